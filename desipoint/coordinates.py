@@ -4,7 +4,11 @@ import numpy as np
 
 r_sw = [0, 55, 110, 165, 220, 275, 330, 385, 435, 480, 510]
 theta_sw = [0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 95]
-def radec_to_altaz(ra, dec, time):
+
+# This is the latitude/longitude of the camera
+camera = (31.96164 * u.deg, -111.60022 * u.deg)
+
+def radec_to_altaz(ra, dec, time, dtype=np.float64):
     """Convert a set of (ra, dec) coordinates to (alt, az) coordinates,
     element-wise.
     Parameters
@@ -15,6 +19,8 @@ def radec_to_altaz(ra, dec, time):
         The declination coordinates.
     time : astropy.time.core.aptime.Time
         The time and date to use in the conversion.
+    dtype : data-type, optional
+        The floating point type of the returned coordinates.
     Returns
     -------
     alt : array_like
@@ -27,11 +33,9 @@ def radec_to_altaz(ra, dec, time):
     Notes
     -----
     The `time` parameter is used for the mapping from altitude and azimuth to
-    right ascension and declination. Astropy is used to perform this conversion.
+    right ascension and declination. Astropy is used to perform this conversion,
+    always in float64, and the result is then cast to `dtype`.
     """
-    # This is the latitude/longitude of the camera
-    camera = (31.96164 * u.deg, -111.60022 * u.deg)
-
     cameraearth = EarthLocation(lat=camera[0], lon=camera[1],
                                 height=2120 * u.meter)
 
@@ -43,9 +47,11 @@ def radec_to_altaz(ra, dec, time):
     # Transforms
     altazcoord = radeccoord.transform_to("altaz")
 
-    return (altazcoord.alt.degree, altazcoord.az.degree)
+    alt = np.asarray(altazcoord.alt.degree, dtype=dtype)
+    az = np.asarray(altazcoord.az.degree, dtype=dtype)
+    return (alt[()], az[()])
 
-def altaz_to_xy(alt, az):
+def altaz_to_xy(alt, az, dtype=np.float64):
     """Convert a set of (alt, az) coordinates to (x, y) coordinates,
     element-wise.
     Parameters
@@ -54,6 +60,9 @@ def altaz_to_xy(alt, az):
         The altitude coordinates.
     az : array_like
         The azimuth coordinates.
+    dtype : data-type, optional
+        The floating point type to do the conversion in. float32 agrees with
+        float64 to well under 0.01 pixels and halves the memory used.
     Returns
     -------
     x : array_like
@@ -67,31 +76,31 @@ def altaz_to_xy(alt, az):
     Kitt Peak National Observatory.
     """
     # In case you pass in lists
-    alt = np.asarray(alt)
-    az = np.asarray(az)
+    alt = np.asarray(alt, dtype=dtype)
+    az = np.asarray(az, dtype=dtype)
 
-    # Reverse of r interpolation
-    r = np.interp(90 - alt, xp=theta_sw, fp=r_sw)
-    az = az + 0.1 # Camera rotated 0.1 degrees.
+    # Reverse of r interpolation. np.interp always works in float64.
+    r = np.interp(90 - alt, xp=theta_sw, fp=r_sw).astype(dtype, copy=False)
+    az = np.asarray(np.radians(az + 0.1)) # Camera rotated 0.1 degrees.
 
     # Angle measured from vertical so sin and cos are swapped from usual polar.
-    # These are x,ys with respect to a zero.
-    x = -1 * r * np.sin(np.radians(az))
-    y = r * np.cos(np.radians(az))
+    # These are x,ys with respect to a zero, scaled in place to avoid
+    # allocating more temporaries.
+    x = np.sin(az)
+    x *= -r
+    y = np.cos(az, out=az)
+    y *= -r
 
     # y is measured from the top!
-    center = (512, 512)
-    x = x + center[0]
-    y = center[1] - y
-
     # Spacewatch camera isn't perfectly aligned, true zenith is 2 to the right
     # and 3 down from center.
-    x += 2
-    y += 3
+    center = (512, 512)
+    x += center[0] + 2
+    y += center[1] + 3
 
-    return (x, y)
+    return (x[()], y[()])
 
-def radec_to_xy(ra, dec, time):
+def radec_to_xy(ra, dec, time, dtype=np.float64):
     """Convert a set of (ra, dec) coordinates to (x, y) coordinates,
     element-wise.
     Parameters
@@ -102,6 +111,8 @@ def radec_to_xy(ra, dec, time):
         The declination coordinates.
     time : astropy.time.core.aptime.Time
         The time and date to use in the conversion.
+    dtype : data-type, optional
+        The floating point type of the returned coordinates.
     Returns
     -------
     x : array_like
@@ -117,20 +128,169 @@ def radec_to_xy(ra, dec, time):
     to altitude and azimuth using radec_to_altaz. It then converts the altitude
     and azimuth coordinates to x and y using altaz_to_xy.
     """
-    alt, az = radec_to_altaz(ra, dec, time)
-    x, y = altaz_to_xy(alt, az)
+    alt, az = radec_to_altaz(ra, dec, time, dtype)
+    x, y = altaz_to_xy(alt, az, dtype)
     return (x, y)
 
-# Function that trims off any points that are outside the ~512 radius circle
+def _float_copy(a):
+    a = np.array(a)
+    return a if a.dtype.kind == "f" else a.astype(float)
+
+# Function that trims off any points that are outside the ~512 radius circle.
+# Returns copies in the same floating point type as the input.
 def trim(x_in, y_in):
-    x = 512 - x_in
-    y = 512 - y_in
-    r = np.hypot(x, y)
+    x = _float_copy(x_in)
+    y = _float_copy(y_in)
+
+    outside = np.hypot(x - 512, y - 512) > 504
+    x[outside] = float("nan")
+    y[outside] = float("nan")
+
+    return (x, y)
+
+
+class CatalogIndex():
+    """Declination band index over a static (ra, dec) catalog.
+
+    Whether a point can be above the horizon depends only on its declination
+    and its hour angle, so for each point we precompute the largest hour angle
+    at which it is still above `min_alt`. Points are then grouped into
+    declination bands and sorted by right ascension within each band, so that
+    for a given local sidereal time the candidates in each band are a
+    contiguous range of right ascension found with a binary search.
+
+    Parameters
+    ----------
+    ra : array_like
+        The right ascension coordinates of the catalog, in degrees.
+    dec : array_like
+        The declination coordinates of the catalog, in degrees.
+    min_alt : float, optional
+        The lowest altitude, in degrees, a point can have and still be
+        selected. The default of -5 degrees is one degree below the edge of
+        the image (see `trim`) to leave room for refraction, precession and
+        nutation, none of which are accounted for in the index.
+    band_width : float, optional
+        The width of each declination band, in degrees.
+
+    Notes
+    -----
+    The selection is conservative: every point that ends up inside the
+    image circle is selected, but some selected points may still be trimmed
+    after the full astropy transform.
+    """
+    def __init__(self, ra, dec, min_alt=-5, band_width=2):
+        self.ra = np.asarray(ra, dtype=float) % 360
+        self.dec = np.asarray(dec, dtype=float)
+        self.min_alt = min_alt
+
+        # Largest hour angle at which each point is above min_alt, from
+        # sin(alt) = sin(lat)sin(dec) + cos(lat)cos(dec)cos(ha)
+        lat = np.radians(camera[0].value)
+        dec_rad = np.radians(self.dec)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cos_ha = ((np.sin(np.radians(min_alt)) - np.sin(lat) * np.sin(dec_rad))
+                      / (np.cos(lat) * np.cos(dec_rad)))
+        # Points with cos_ha > 1 never rise (-1 marks them as never visible),
+        # and points with cos_ha < -1 never set.
+        self.max_ha = np.degrees(np.arccos(np.clip(cos_ha, -1, 1)))
+        self.max_ha[cos_ha > 1] = -1
+
+        band = np.floor((self.dec + 90) / band_width).astype(int)
+
+        # Sort by band first then by right ascension within the band.
+        self.order = np.lexsort((self.ra, band))
+        sorted_band = band[self.order]
+        self.sorted_ra = self.ra[self.order]
+
+        self.bands = []
+        edges = np.flatnonzero(np.diff(sorted_band)) + 1
+        for start, end in zip(np.concatenate([[0], edges]),
+                              np.concatenate([edges, [len(sorted_band)]])):
+            # Only an empty catalog has an empty band.
+            if start == end:
+                continue
+            band_ha = self.max_ha[self.order[start:end]].max()
+            if band_ha >= 0:
+                self.bands.append((start, end, band_ha))
+
+    def __len__(self):
+        return len(self.ra)
+
+    def visible(self, time):
+        """Find the catalog points that may be above `min_alt` at a time.
+
+        Parameters
+        ----------
+        time : astropy.time.core.aptime.Time
+            The time and date to select the points at.
+
+        Returns
+        -------
+        idx : numpy.ndarray
+            Sorted indices into the catalog of the points above `min_alt`.
+        """
+        lst = time.sidereal_time("mean", longitude=camera[1]).degree
+
+        candidates = []
+        for start, end, band_ha in self.bands:
+            ras = self.sorted_ra[start:end]
+            if band_ha >= 180:
+                candidates.append(self.order[start:end])
+                continue
+
+            # The visible right ascension range in this band may wrap around
+            # 0/360, in which case we take both ends of the band.
+            low = (lst - band_ha) % 360
+            high = (lst + band_ha) % 360
+            i = start + np.searchsorted(ras, low, side="left")
+            j = start + np.searchsorted(ras, high, side="right")
+            if low <= high:
+                candidates.append(self.order[i:j])
+            else:
+                candidates.append(self.order[start:j])
+                candidates.append(self.order[i:end])
+
+        if not candidates:
+            return np.array([], dtype=int)
+        idx = np.concatenate(candidates)
+
+        # Refine the band level selection with each point's own limit.
+        ha = np.abs((lst - self.ra[idx] + 180) % 360 - 180)
+        idx = idx[ha <= self.max_ha[idx]]
+
+        return np.sort(idx)
+
+    def project(self, time, dtype=np.float64):
+        """Convert the catalog points that are in view at a time to (x, y).
+
+        Parameters
+        ----------
+        time : astropy.time.core.aptime.Time
+            The time and date to use in the conversion.
+        dtype : data-type, optional
+            The floating point type of the returned coordinates.
+
+        Returns
+        -------
+        idx : numpy.ndarray
+            Indices into the catalog of the projected points.
+        x : numpy.ndarray
+            The x coordinates of the points at `idx`.
+        y : numpy.ndarray
+            The y coordinates of the points at `idx`.
+
+        See Also
+        --------
+        radec_to_xy : Convert a set of (ra, dec) coordinates to (x, y).
+        """
+        idx = self.visible(time)
+        if len(idx) == 0:
+            return idx, np.array([], dtype=dtype), np.array([], dtype=dtype)
 
-    # TODO: Vectorize this using numpy
-    for i in range(len(r)):
-        if r[i] > 504:
-            x[i] = float("nan")
-            y[i] = float("nan")
+        x, y = radec_to_xy(self.ra[idx], self.dec[idx], time, dtype)
+        x, y = trim(x, y)
 
-    return (512 - x, 512 - y)
+        # Drop the candidates that only just failed to make the image.
+        inside = ~np.isnan(x)
+        return idx[inside], x[inside], y[inside]
@@ -1,41 +1,28 @@
-from astropy.time import Time, TimeDelta
+from astropy.time import TimeDelta
 from matplotlib.patches import Polygon, Circle, Rectangle
 import matplotlib.pyplot as plt
 
 from datetime import datetime
 
 from .io import (load_survey, load_milky_way, load_ecliptic, download_telemetry,
-                download_image)
+                download_image, image_time)
 from .coordinates import altaz_to_xy
 
 def create_image(time, image=None, toggle_mw=False, toggle_ep=False, toggle_survey=False,
-                 toggle_pointing=False):
+                 toggle_pointing=False, pointing=None):
 
-    # If image isn't passed in then we download the image
-    # Start and end times for image range.
-    if time == "now":
-        im_time = Time.now().iso
-    else:
-        im_time = Time(time).iso
-
-    # Updating the start time to be the next available image.
-    temp_time = str(im_time)
-    minutes = int(temp_time[-9:-7])
-    # Sets minutes to next even minute if it is odd, and remains the same if even
-    minutes = (minutes + 1) // 2 * 2
-
-    # Sets the seconds to always be at 5 seconds. This time format (Even minutes
-    # and 5 seconds after) is the datetime each image is taken.
-    temp_time = temp_time[:-9] + str(minutes) + ":05.000"
-    im_time = Time(temp_time)
+    # Updating the time to be the next available image.
+    im_time = image_time(time)
     print(f"Image for at {str(im_time)}")
 
+    # If image isn't passed in then we download the image
     if image is None:
         print("Preparing to download image.")
 
         image = download_image(im_time)
 
-    if toggle_pointing:
+    # Pointing is a row of (time_recorded, mount_el, mount_az) telemetry.
+    if toggle_pointing and pointing is None:
             print("Downloading telemetry...")
             pointing = download_telemetry(im_time)[1]
 
@@ -3,10 +3,13 @@ import numpy as np
 from PIL import Image, UnidentifiedImageError
 import requests
 
+from concurrent.futures import ThreadPoolExecutor
 import csv
+from datetime import timedelta
 import json
 from io import BytesIO
 import os
+import re
 
 from .coordinates import radec_to_xy, trim
 
@@ -17,6 +20,7 @@ class AllSkyImage():
 
 
 base_url = "http://varuna.kpno.noirlab.edu/allsky-all/images/cropped/"
+telemetry_url = "https://replicator.desi.lbl.gov/TV3/app/Q/query"
 
 def load_ecliptic(time, radec=False):
     ep_loc = os.path.join(os.path.dirname(__file__), "data", "ecliptic.json")
@@ -96,7 +100,7 @@ def download_telemetry(time):
       return
 
   print("Preparing to download image and telemetry.")
-  query_url = "https://replicator.desi.lbl.gov/TV3/app/Q/query"
+  query_url = telemetry_url
   params = {"namespace": "telemetry", "format": "csv",
             "sql": f"select time_recorded,mount_el,mount_az from telemetry.tcs_info where time_recorded < TIMESTAMP '{str(time)}' order by time_recorded desc limit 1"}
   # Ok so first get the resulting call, and decode it because its in bytes
@@ -110,18 +114,200 @@ def download_telemetry(time):
   cr = csv.reader(decoded.splitlines(), delimiter=',')
   return list(cr)
 
+def download_telemetry_range(start, end):
+    """Download every telemetry update between two times in a single query.
 
-def download_image(time):
+    Returns the table as a 2-d list with the column titles in the first row,
+    or None if authentication failed.
+
+    See Also
+    --------
+    match_pointings : Pick the telemetry update in effect at each time.
+    """
+    try:
+        with open("auth.txt", "r") as f:
+            auth = json.load(f)
+    except Exception as e:
+        print("Loading authentication failed.")
+        print(e)
+        return
+
+    params = {"namespace": "telemetry", "format": "csv",
+              "sql": f"select time_recorded,mount_el,mount_az from telemetry.tcs_info where time_recorded >= TIMESTAMP '{str(start)}' AND time_recorded < TIMESTAMP '{str(end)}' order by time_recorded asc"}
+    r = requests.get(telemetry_url, params=params, auth=(auth["usr"], auth["pass"]))
+    if r.status_code == 401:
+        print("Invalid authentication!")
+        return
+    decoded = r.content.decode("utf-8")
+    cr = csv.reader(decoded.splitlines(), delimiter=',')
+    return list(cr)
+
+def match_pointings(telemetry, times):
+    """Find the last telemetry update recorded before each time.
+
+    Parameters
+    ----------
+    telemetry : list
+        The table from `download_telemetry_range`, in time order. It must
+        have at least one row after the column titles.
+    times : list
+        The times to find the pointing at.
+
+    Returns
+    -------
+    pointings : list
+        One telemetry row of (time_recorded, mount_el, mount_az) per time.
+        Times before the first update get the first update.
+    """
+    # Strip off the time zone, and offset by one to skip the column titles.
+    telemetry_times = Time([r[0][:-6] for r in telemetry[1:]]).mjd
+    idx = np.searchsorted(telemetry_times, Time(times).mjd) - 1
+    return [telemetry[i + 1] for i in np.clip(idx, 0, None)]
+
+
+def image_time(time):
+    """Round a time to the time of the image for it.
+
+    Images are taken on even minutes at 5 seconds past the minute. A time in
+    an even minute maps to 5 seconds past that same minute, even if that is
+    earlier than the time, and a time in an odd minute maps to 5 seconds past
+    the next even minute.
+
+    Parameters
+    ----------
+    time : str or astropy.time.core.aptime.Time
+        The time to round, or "now".
+
+    Returns
+    -------
+    im_time : astropy.time.core.aptime.Time
+        The time of the image, in iso format.
+    """
+    if isinstance(time, str) and time == "now":
+        time = Time.now()
+    t = Time(time).datetime
+
+    minutes = (t.minute + 1) // 2 * 2
+    # Added as a timedelta so that rounding past the hour or day carries over.
+    t = t.replace(minute=0, second=5, microsecond=0) + timedelta(minutes=minutes)
+
+    im_time = Time(t)
+    im_time.format = "iso"
+    return im_time
+
+def image_url(time):
+    """The archive URL of the image taken at `time`."""
     t = str(time)
     d = t.split(" ")[0] # Extract the current date in case the range ticks over.
     t = t.replace(":", "").replace("-", "").replace(" ", "_").split(".")[0]
-    file_name = t + ".jpg"
+    return base_url + d.replace("-", "/") + "/" + t + ".jpg"
+
+# Cached directory listings and HEAD results, keyed by URL.
+_listing_cache = {}
+_head_cache = {}
+
+def _listing(directory_url, final):
+    if directory_url in _listing_cache:
+        return _listing_cache[directory_url]
+
+    try:
+        response = requests.get(directory_url, timeout=30)
+    except requests.RequestException:
+        return None
+    if (response.status_code != 200
+            or not response.headers.get("Content-Type", "").startswith("text/html")):
+        return None
+
+    # An error page or a directory with listings turned off can still be a
+    # 200 HTML page, so a listing without any images isn't trusted and the
+    # images are checked one by one instead.
+    names = set(re.findall(r"\d{8}_\d{6}\.jpg", response.text))
+    if not names:
+        return None
+
+    # Only nights that are over won't get any new images.
+    if final:
+        _listing_cache[directory_url] = names
+    return names
+
+def _exists(url, final):
+    if url in _head_cache:
+        return _head_cache[url]
+
+    try:
+        response = requests.head(url, timeout=30)
+    except requests.RequestException:
+        return False
+    exists = (response.status_code == 200
+              and response.headers.get("Content-Type", "").startswith("image"))
+
+    if exists or final:
+        _head_cache[url] = exists
+    return exists
+
+def available_times(start, end, workers=8):
+    """Find which images exist in the archive between two times.
+
+    For each night in the range the archive directory listing is downloaded
+    once. If a listing is not available then each image is checked with a
+    HEAD request instead, with the requests run in parallel. Results for
+    nights that are over are cached, since no more images will appear.
+
+    Parameters
+    ----------
+    start : str or astropy.time.core.aptime.Time
+        The start of the range, rounded to the first image with `image_time`.
+    end : str or astropy.time.core.aptime.Time
+        The end of the range. No images at or after this time are included.
+    workers : int, optional
+        The number of HEAD requests to run at once.
+
+    Returns
+    -------
+    times : list
+        The times of the images that exist, in order.
+    """
+    end = Time(end)
+    today = Time.now().datetime.date()
+
+    # Images are taken every 120 seconds.
+    slots = []
+    cur_time = image_time(start)
+    while cur_time < end:
+        slots.append(cur_time)
+        cur_time += TimeDelta(120, format="sec")
+
+    urls = [image_url(t) for t in slots]
+    final = [t.datetime.date() < today for t in slots]
+
+    # Each night's listing is only downloaded once per call.
+    listings = {}
+    exists = [None] * len(slots)
+    for i, url in enumerate(urls):
+        directory_url, name = url.rsplit("/", 1)
+        if directory_url not in listings:
+            listings[directory_url] = _listing(directory_url + "/", final[i])
+        names = listings[directory_url]
+        if names is not None:
+            exists[i] = name in names
+
+    missing = [i for i, e in enumerate(exists) if e is None]
+    if missing:
+        with ThreadPoolExecutor(workers) as pool:
+            results = pool.map(lambda i: _exists(urls[i], final[i]), missing)
+            for i, result in zip(missing, results):
+                exists[i] = result
+
+    return [t for t, e in zip(slots, exists) if e]
+
+def download_image(time):
+    t = str(time).replace(":", "").replace("-", "").replace(" ", "_").split(".")[0]
     if abs(time - Time.now()) < TimeDelta(60 * 2, format="sec"):
         # Download from the current website if the image is for "now"
         url = "http://gagarin.lpl.arizona.edu/allsky/AllSkyCurrentImage.jpg"
     else:
         # Get the image data for this time from the server and then load
-        url = base_url + d.replace("-", "/") + "/" + file_name
+        url = image_url(time)
     try:
         response = requests.get(url)
         img = np.asarray(Image.open(BytesIO(response.content)))
@@ -0,0 +1,211 @@
+from astropy.time import Time, TimeDelta
+import numpy as np
+
+from .coordinates import altaz_to_xy, radec_to_xy, trim
+from .io import load_survey, load_milky_way, load_ecliptic
+
+# Order of the layers in every encoded frame.
+layers = ("survey", "mw", "ep", "pointing")
+
+def simplify(points, tolerance):
+    """Simplify a polyline with the Ramer-Douglas-Peucker algorithm.
+
+    Parameters
+    ----------
+    points : numpy.ndarray
+        The (n, 2) array of (x, y) points along the line.
+    tolerance : float
+        The largest distance in pixels any removed point may be from the
+        simplified line.
+
+    Returns
+    -------
+    simplified : numpy.ndarray
+        The subset of `points` that is kept, always including the end points.
+    """
+    n = len(points)
+    if n < 3:
+        return points
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    # Iterative rather than recursive so long lines can't hit the recursion
+    # limit.
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+
+        seg = points[j] - points[i]
+        rel = points[i + 1:j] - points[i]
+        length = np.hypot(seg[0], seg[1])
+        if length == 0:
+            # Closed rings start and end on the same point.
+            dist = np.hypot(rel[:, 0], rel[:, 1])
+        else:
+            dist = np.abs(seg[0] * rel[:, 1] - seg[1] * rel[:, 0]) / length
+
+        k = np.argmax(dist)
+        if dist[k] > tolerance:
+            mid = i + 1 + k
+            keep[mid] = True
+            stack.append((i, mid))
+            stack.append((mid, j))
+
+    return points[keep]
+
+def _split(x, y):
+    # Trimmed points are NaN, so each run of points between them is a
+    # separate line on the image.
+    points = np.column_stack([x, y])
+    valid = ~np.isnan(points).any(axis=1)
+    edges = np.flatnonzero(np.diff(valid.astype(int))) + 1
+    runs = np.split(points, edges)
+    return [run for run in runs if len(run) > 1 and not np.isnan(run[0, 0])]
+
+def load_catalog():
+    """Load the (ra, dec) of every overlay line once.
+
+    Returns
+    -------
+    catalog : dict
+        `survey` is a list of the (ra, dec) arrays of the two survey area
+        polygons, `mw` and `ep` are the (ra, dec) arrays of the Milky Way and
+        ecliptic.
+    """
+    left_ra, left_dec, right_ra, right_dec = load_survey(None, radec=True)
+    return {"survey": [(np.asarray(left_ra), np.asarray(left_dec)),
+                       (np.asarray(right_ra), np.asarray(right_dec))],
+            "mw": tuple(np.asarray(c) for c in load_milky_way(None, radec=True)),
+            "ep": tuple(np.asarray(c) for c in load_ecliptic(None, radec=True))}
+
+def overlay_geometry(time, pointing=None, tolerance=0.5, catalog=None):
+    """Project the overlays for a time to simplified (x, y) image geometry.
+
+    Parameters
+    ----------
+    time : astropy.time.core.aptime.Time
+        The time and date to project the overlays for.
+    pointing : list, optional
+        A telemetry row of (time_recorded, mount_el, mount_az) to include the
+        telescope pointing.
+    tolerance : float, optional
+        The simplification tolerance, in pixels.
+    catalog : dict, optional
+        The overlay lines from `load_catalog`, which is called if this is not
+        given. Pass it in to project many times without reloading it.
+
+    Returns
+    -------
+    geometry : dict
+        `survey` is a list of the two survey area polygons, `mw` and `ep` are
+        lists of the Milky Way and ecliptic line pieces that are on the image,
+        each an (n, 2) array of (x, y) points. `pointing` is the (x, y) of the
+        telescope pointing, or None.
+    """
+    if catalog is None:
+        catalog = load_catalog()
+
+    # The survey polygons aren't trimmed, the same as in load_survey.
+    survey = [np.column_stack(radec_to_xy(ra, dec, time)) for ra, dec in catalog["survey"]]
+    mw_x, mw_y = trim(*radec_to_xy(*catalog["mw"], time))
+    ep_x, ep_y = trim(*radec_to_xy(*catalog["ep"], time))
+
+    geometry = {"survey": [simplify(p, tolerance) for p in survey],
+                "mw": [simplify(p, tolerance) for p in _split(mw_x, mw_y)],
+                "ep": [simplify(p, tolerance) for p in _split(ep_x, ep_y)],
+                "pointing": None}
+    if pointing is not None:
+        geometry["pointing"] = np.asarray(altaz_to_xy(float(pointing[1]), float(pointing[2])))
+    return geometry
+
+def encode(geometry, precision=0.1):
+    """Delta encode overlay geometry into a compact JSON serializable frame.
+
+    Each line is quantized to integer multiples of `precision` pixels and
+    flattened to [x0, y0, dx1, dy1, ...] where the first point is absolute
+    and the rest are offsets from the previous point.
+
+    Returns
+    -------
+    frame : list
+        The encoded layers in the order of `layers`. The pointing is a
+        quantized [x, y] pair, or None.
+    """
+    def encode_line(points):
+        q = np.round(np.asarray(points) / precision).astype(int)
+        q[1:] = np.diff(q, axis=0)
+        return q.ravel().tolist()
+
+    frame = [[encode_line(p) for p in geometry[layer]] for layer in layers[:-1]]
+    pointing = geometry["pointing"]
+    if pointing is None:
+        frame.append(None)
+    else:
+        frame.append(np.round(pointing / precision).astype(int).tolist())
+    return frame
+
+def decode(frame, precision=0.1):
+    """Invert `encode`, returning geometry of the form `overlay_geometry` does."""
+    def decode_line(flat):
+        q = np.asarray(flat).reshape(-1, 2)
+        return np.cumsum(q, axis=0) * precision
+
+    geometry = {layer: [decode_line(p) for p in lines]
+                for layer, lines in zip(layers[:-1], frame)}
+    geometry["pointing"] = None if frame[-1] is None else np.asarray(frame[-1]) * precision
+    return geometry
+
+def export_overlay(time, pointing=None, tolerance=0.5, precision=0.1):
+    """Export the encoded overlay for a single time.
+
+    See Also
+    --------
+    export_series : Export the encoded overlays for a range of times.
+    """
+    time = Time(time)
+    return {"time": str(time), "precision": precision, "layers": layers,
+            "frame": encode(overlay_geometry(time, pointing, tolerance), precision)}
+
+def series_times(start, end, step=120):
+    """The frame times of `export_series`, every `step` seconds before `end`."""
+    times = []
+    cur_time = Time(start)
+    while cur_time < Time(end):
+        times.append(cur_time)
+        cur_time += TimeDelta(step, format="sec")
+    return times
+
+def export_series(start, end, step=120, pointings=None, tolerance=0.5, precision=0.1):
+    """Export the encoded overlays for a range of times.
+
+    The overlay catalog is loaded once and projected for each frame. The
+    layer order, precision and timing are stored once for the whole series,
+    and each frame only holds the encoded coordinates. Frame `i` is
+    for the time `start + i * step`.
+
+    Parameters
+    ----------
+    start : str or astropy.time.core.aptime.Time
+        The time of the first frame.
+    end : str or astropy.time.core.aptime.Time
+        The time no frames will be at or after.
+    step : float, optional
+        The time between frames, in seconds.
+    pointings : list, optional
+        A telemetry row per frame in `series_times` to include the telescope
+        pointing.
+    """
+    start = Time(start)
+    catalog = load_catalog()
+
+    frames = []
+    for i, cur_time in enumerate(series_times(start, end, step)):
+        pointing = None if pointings is None else pointings[i]
+        geometry = overlay_geometry(cur_time, pointing, tolerance, catalog)
+        frames.append(encode(geometry, precision))
+
+    return {"start": str(start), "step": step, "precision": precision,
+            "layers": layers, "frames": frames}
@@ -0,0 +1,241 @@
+from astropy.time import Time
+import matplotlib.pyplot as plt
+
+import argparse
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import json
+import multiprocessing
+from urllib.parse import urlsplit, parse_qs
+
+from .image import create_image
+from .io import AllSkyImage, download_image, download_telemetry, image_time
+from .overlay import export_overlay
+
+status_text = {200: "OK", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 500: "Internal Server Error",
+               502: "Bad Gateway"}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def render_png(time, data, pointing, toggles):
+    """Render an all-sky image with overlays to PNG bytes.
+
+    This is run in the worker pool, so it takes only plain picklable
+    arguments rather than an AllSkyImage.
+    """
+    image = AllSkyImage(data, Time(time))
+    fig, _, dpi = create_image(time, image, *toggles, pointing=pointing)
+
+    buf = BytesIO()
+    fig.savefig(buf, format="png", dpi=dpi)
+    plt.close(fig)
+    return buf.getvalue()
+
+def process_pool(workers=None):
+    """A process pool whose workers don't inherit the server's sockets.
+
+    The pool starts its workers lazily, on the first render, by which point
+    the listening socket and client connections are open. Forked workers
+    would hold copies of those sockets and closing a connection would never
+    reach the client, so the workers are spawned instead.
+    """
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+class OverlayServer():
+    """Asyncio HTTP server for rendered all-sky images and overlay coordinates.
+
+    Two endpoints are served, both taking the image time as a `time` query
+    parameter in ISO-8601 format or "now", rounded with `io.image_time`:
+
+    - ``/image.png`` returns the rendered image. The overlays are toggled with
+      the `mw`, `ep`, `survey` and `pointing` query parameters.
+    - ``/overlay.json`` returns the encoded overlay geometry from
+      `overlay.export_overlay` for drawing client side, including the
+      telescope pointing if the `pointing` query parameter is set.
+
+    Identical requests that arrive while one is already in flight wait on the
+    same result instead of repeating the download, telemetry query and render,
+    and the most recent results are kept in a least recently used cache.
+    Rendering and projection run in `executor`, downloads run in the event
+    loop's default thread pool.
+
+    Parameters
+    ----------
+    host : str, optional
+        The address to listen on.
+    port : int, optional
+        The port to listen on. 0 picks a free port, see `port` after `start`.
+    cache_size : int, optional
+        The number of results (downloads and renders) to keep in memory.
+    executor : concurrent.futures.Executor, optional
+        The pool to render in. Defaults to a spawned process pool from
+        `process_pool`. The pool is shut down by `close`.
+    """
+    def __init__(self, host="127.0.0.1", port=8080, cache_size=64, executor=None):
+        self.host = host
+        self.port = port
+        self.cache_size = cache_size
+        self.executor = executor if executor is not None else process_pool()
+
+        self.cache = OrderedDict()
+        self.in_flight = {}
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"Serving on http://{self.host}:{self.port}")
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+        # Waiting for the workers to exit blocks, so do it off the event loop.
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.executor.shutdown)
+
+    def _store(self, key, task):
+        self.in_flight.pop(key, None)
+        # Failures are not cached so the next request tries again.
+        if task.cancelled() or task.exception() is not None:
+            return
+        self.cache[key] = task.result()
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def cached(self, key, factory):
+        """Get the result for `key`, coalescing with any in-flight request.
+
+        `factory` is a coroutine function that computes the result and is
+        only called if the result is neither cached nor already in flight.
+        """
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda t: self._store(key, t))
+
+        # Shielded so that one client disconnecting doesn't cancel the work
+        # for everyone else waiting on it.
+        return await asyncio.shield(task)
+
+    async def get_image(self, time):
+        async def factory():
+            loop = asyncio.get_running_loop()
+            image = await loop.run_in_executor(None, download_image, time)
+            if image is None:
+                raise HTTPError(404, f"No image found for {time}.")
+            return image.data
+        return await self.cached(("image", str(time)), factory)
+
+    async def get_pointing(self, time):
+        async def factory():
+            loop = asyncio.get_running_loop()
+            telemetry = await loop.run_in_executor(None, download_telemetry, time)
+            if not telemetry or len(telemetry) < 2:
+                raise HTTPError(502, "Telemetry query failed.")
+            return telemetry[1]
+        return await self.cached(("pointing", str(time)), factory)
+
+    async def get_png(self, time, toggles):
+        async def factory():
+            data = await self.get_image(time)
+            pointing = await self.get_pointing(time) if toggles[3] else None
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, render_png, str(time),
+                                              data, pointing, toggles)
+        return await self.cached(("png", str(time), toggles), factory)
+
+    async def get_overlay(self, time, toggle_pointing):
+        async def factory():
+            pointing = await self.get_pointing(time) if toggle_pointing else None
+            loop = asyncio.get_running_loop()
+            overlay = await loop.run_in_executor(self.executor, export_overlay,
+                                                 str(time), pointing)
+            return json.dumps(overlay, separators=(",", ":")).encode("utf-8")
+        return await self.cached(("overlay", str(time), toggle_pointing), factory)
+
+    async def route(self, method, target):
+        if method != "GET":
+            raise HTTPError(405, f"Method {method} not allowed.")
+
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+
+        def flag(name):
+            return query.get(name, ["0"])[0].lower() in ("1", "true", "yes")
+
+        try:
+            # Rounded to the image time so that every request for the same
+            # image shares a cache entry.
+            time = image_time(query["time"][0])
+        except (KeyError, ValueError):
+            raise HTTPError(400, "A valid time parameter is required.")
+
+        if url.path == "/image.png":
+            toggles = (flag("mw"), flag("ep"), flag("survey"), flag("pointing"))
+            return "image/png", await self.get_png(time, toggles)
+        elif url.path == "/overlay.json":
+            return "application/json", await self.get_overlay(time, flag("pointing"))
+        raise HTTPError(404, f"Unknown path {url.path}.")
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1")
+            # Headers aren't needed for anything, so read past them.
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            try:
+                method, target, _ = request_line.split(" ", 2)
+            except ValueError:
+                raise HTTPError(400, "Malformed request line.")
+
+            status = 200
+            content_type, body = await self.route(method, target)
+        except HTTPError as e:
+            status = e.status
+            content_type, body = "text/plain", str(e).encode("utf-8")
+        except Exception as e:
+            print(f"Request failed: {e!r}")
+            status = 500
+            content_type, body = "text/plain", b"Internal server error."
+
+        header = (f"HTTP/1.1 {status} {status_text[status]}\r\n"
+                  f"Content-Type: {content_type}\r\n"
+                  f"Content-Length: {len(body)}\r\n"
+                  "Connection: close\r\n\r\n")
+        try:
+            writer.write(header.encode("latin-1") + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host, port, cache_size, workers):
+    server = OverlayServer(host, port, cache_size, process_pool(workers))
+    await server.start()
+    async with server.server:
+        await server.server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", help="address to listen on", default="127.0.0.1")
+    parser.add_argument("--port", help="port to listen on", type=int, default=8080)
+    parser.add_argument("--cache", help="number of results to keep in memory", type=int, default=64)
+    parser.add_argument("--workers", help="number of rendering processes", type=int, default=None)
+
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.cache, args.workers))
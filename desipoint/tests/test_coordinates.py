@@ -4,7 +4,8 @@ import unittest
 from astropy.time import Time
 import numpy as np
 
-from desipoint.coordinates import altaz_to_xy, radec_to_xy, radec_to_altaz
+from desipoint.coordinates import (altaz_to_xy, radec_to_xy, radec_to_altaz,
+                                  trim, CatalogIndex)
 
 file_loc = pathlib.Path(__file__).parent.resolve() / "test_files"
 
@@ -37,6 +38,18 @@ class TestCoordinateConversions(unittest.TestCase):
         self.assertTrue(np.allclose(observed_x, expected[0]))
         self.assertTrue(np.allclose(observed_y, expected[1]))
 
+        # Reduced precision has to stay within a hundredth of a pixel.
+        observed_x, observed_y = radec_to_xy(radec_grid[0], radec_grid[1], t, np.float32)
+        self.assertEqual(observed_x.dtype, np.float32)
+        self.assertEqual(observed_y.dtype, np.float32)
+        self.assertLess(np.max(np.abs(observed_x - expected[0])), 0.01)
+        self.assertLess(np.max(np.abs(observed_y - expected[1])), 0.01)
+
+        # Trimming keeps the reduced precision.
+        trimmed_x, trimmed_y = trim(observed_x, observed_y)
+        self.assertEqual(trimmed_x.dtype, np.float32)
+        self.assertEqual(trimmed_y.dtype, np.float32)
+
 
     def test_altaz_to_xy(self):
         # Set up the alt az grid
@@ -66,3 +79,37 @@ class TestCoordinateConversions(unittest.TestCase):
         # Expected is a vstack of the two observed arrays.
         self.assertTrue(np.allclose(observed_x, expected[0]))
         self.assertTrue(np.allclose(observed_y, expected[1]))
+
+        # Reduced precision has to stay within a hundredth of a pixel.
+        observed_x, observed_y = altaz_to_xy(alt, az, np.float32)
+        self.assertEqual(observed_x.dtype, np.float32)
+        self.assertEqual(observed_y.dtype, np.float32)
+        self.assertLess(np.max(np.abs(observed_x - expected[0])), 0.01)
+        self.assertLess(np.max(np.abs(observed_y - expected[1])), 0.01)
+
+    def test_catalog_index(self):
+        # Uniform random points over the whole sphere.
+        rng = np.random.default_rng(2021)
+        ra = rng.uniform(0, 360, 20000)
+        dec = np.degrees(np.arcsin(rng.uniform(-1, 1, 20000)))
+
+        t = Time("2021-10-09T08:45:00Z")
+        index = CatalogIndex(ra, dec)
+
+        # Reference is projecting everything and trimming afterwards.
+        expected_x, expected_y = trim(*radec_to_xy(ra, dec, t))
+        expected_idx = np.flatnonzero(~np.isnan(expected_x))
+
+        visible = index.visible(t)
+        self.assertTrue(np.all(np.isin(expected_idx, visible)))
+        self.assertLess(len(visible), len(ra) * 0.6)
+
+        observed_idx, observed_x, observed_y = index.project(t)
+        self.assertTrue(np.array_equal(observed_idx, expected_idx))
+        self.assertTrue(np.allclose(observed_x, expected_x[expected_idx]))
+        self.assertTrue(np.allclose(observed_y, expected_y[expected_idx]))
+
+        # An empty catalog has nothing in view.
+        observed_idx, observed_x, observed_y = CatalogIndex([], []).project(t)
+        self.assertEqual(len(observed_idx), 0)
+        self.assertEqual(len(observed_x), 0)
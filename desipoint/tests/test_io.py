@@ -0,0 +1,84 @@
+import unittest
+
+import desipoint.io
+from desipoint.io import image_time, available_times, match_pointings
+from upstream import RecordingHandler, start_upstream, patch_io
+
+# Stand-in for the image archive. 2021/10/09 has a directory listing,
+# 2021/10/10 only answers HEAD requests and 2021/10/11 answers with an error
+# page instead of a listing.
+existing = {"20211009_084405.jpg", "20211009_084805.jpg",
+            "20211010_000005.jpg", "20211011_000205.jpg"}
+
+class Archive(RecordingHandler):
+    def do_GET(self):
+        self.record()
+        if self.path == "/2021/10/09/":
+            body = "".join(f'<a href="{name}">{name}</a>' for name in sorted(existing))
+            self.send_body(body.encode("utf-8"), "text/html")
+        elif self.path == "/2021/10/11/":
+            self.send_body(b"<html>Directory listing disabled</html>", "text/html")
+        else:
+            self.send_error(404)
+
+    def do_HEAD(self):
+        self.record()
+        if self.path.rsplit("/", 1)[-1] in existing:
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.end_headers()
+        else:
+            self.send_error(404)
+
+
+class TestAvailability(unittest.TestCase):
+    def setUp(self):
+        desipoint.io._listing_cache.clear()
+        desipoint.io._head_cache.clear()
+
+        patch_io(self, base_url=start_upstream(self, Archive) + "/")
+
+    def test_image_time(self):
+        # Odd minutes go to the next even minute, including over the day.
+        self.assertEqual(str(image_time("2021-10-09T08:43:50")), "2021-10-09 08:44:05.000")
+        self.assertEqual(str(image_time("2021-10-09T08:44:50")), "2021-10-09 08:44:05.000")
+        self.assertEqual(str(image_time("2021-10-09T08:05:00")), "2021-10-09 08:06:05.000")
+        self.assertEqual(str(image_time("2021-10-09T23:59:00")), "2021-10-10 00:00:05.000")
+
+    def test_available_times(self):
+        times = available_times("2021-10-09T08:44:00", "2021-10-09T08:50:00")
+        self.assertEqual([str(t) for t in times],
+                         ["2021-10-09 08:44:05.000", "2021-10-09 08:48:05.000"])
+        self.assertEqual(Archive.requests, [("GET", "/2021/10/09/")])
+
+        # The listing for a finished night is cached.
+        available_times("2021-10-09T08:44:00", "2021-10-09T08:50:00")
+        self.assertEqual(len(Archive.requests), 1)
+
+    def test_head_fallback(self):
+        times = available_times("2021-10-09T23:58:00", "2021-10-10T00:04:00")
+        self.assertEqual([str(t) for t in times], ["2021-10-10 00:00:05.000"])
+
+        heads = sorted(path for method, path in Archive.requests if method == "HEAD")
+        self.assertEqual(heads, ["/2021/10/10/20211010_000005.jpg",
+                                 "/2021/10/10/20211010_000205.jpg"])
+
+    def test_error_page_listing(self):
+        times = available_times("2021-10-11T00:00:00", "2021-10-11T00:04:00")
+        self.assertEqual([str(t) for t in times], ["2021-10-11 00:02:05.000"])
+
+        # The error page isn't cached as an empty listing.
+        self.assertNotIn(desipoint.io.base_url + "2021/10/11/", desipoint.io._listing_cache)
+        heads = sorted(path for method, path in Archive.requests if method == "HEAD")
+        self.assertEqual(heads, ["/2021/10/11/20211011_000005.jpg",
+                                 "/2021/10/11/20211011_000205.jpg"])
+
+    def test_match_pointings(self):
+        telemetry = [["time_recorded", "mount_el", "mount_az"],
+                     ["2021-10-09 08:43:58.000000+00:00", "60.0", "120.0"],
+                     ["2021-10-09 08:44:02.000000+00:00", "61.0", "121.0"],
+                     ["2021-10-09 08:46:01.000000+00:00", "62.0", "122.0"]]
+        times = ["2021-10-09 08:43:00", "2021-10-09 08:44:05", "2021-10-09 08:46:05"]
+
+        pointings = match_pointings(telemetry, times)
+        self.assertEqual([p[1] for p in pointings], ["60.0", "61.0", "62.0"])
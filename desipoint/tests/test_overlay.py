@@ -0,0 +1,40 @@
+import json
+import unittest
+
+from astropy.time import Time
+import numpy as np
+
+from desipoint.overlay import (simplify, overlay_geometry, encode, decode,
+                               export_series)
+
+class TestOverlay(unittest.TestCase):
+    def test_simplify(self):
+        # A straight line with a little noise collapses to its end points,
+        # a corner is kept.
+        x = np.linspace(0, 100, 101)
+        y = np.where(x < 50, 0.1 * np.sin(x), x - 50)
+        simplified = simplify(np.column_stack([x, y]), 0.5)
+
+        self.assertEqual(simplified.tolist(), [[0, 0], [50, 0], [100, 50]])
+
+    def test_round_trip(self):
+        t = Time("2021-10-09T08:45:00Z")
+        pointing = ["2021-10-09 08:44:58.000000+00:00", "60.0", "120.0"]
+        geometry = overlay_geometry(t, pointing, tolerance=0.5)
+
+        precision = 0.1
+        decoded = decode(json.loads(json.dumps(encode(geometry, precision))), precision)
+        for layer in ("survey", "mw", "ep"):
+            self.assertEqual(len(decoded[layer]), len(geometry[layer]))
+            for observed, expected in zip(decoded[layer], geometry[layer]):
+                self.assertTrue(np.allclose(observed, expected, rtol=0, atol=precision))
+        self.assertTrue(np.allclose(decoded["pointing"], geometry["pointing"],
+                                    rtol=0, atol=precision))
+
+    def test_series(self):
+        series = export_series("2021-10-09T08:00:05", "2021-10-09T08:10:00", 120)
+
+        self.assertEqual(len(series["frames"]), 5)
+        self.assertEqual(series["layers"], ("survey", "mw", "ep", "pointing"))
+        for frame in series["frames"]:
+            self.assertEqual(len(frame), len(series["layers"]))
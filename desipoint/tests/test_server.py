@@ -0,0 +1,119 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from desipoint.server import OverlayServer
+from upstream import RecordingHandler, start_upstream, patch_io
+
+# Stand-in for both the image archive and the telemetry database.
+class Upstream(RecordingHandler):
+    def do_GET(self):
+        self.record()
+        if self.path.startswith("/images/"):
+            buf = BytesIO()
+            Image.fromarray(np.zeros((1024, 1024), dtype=np.uint8)).save(buf, format="jpeg")
+            self.send_body(buf.getvalue(), "image/jpeg")
+        elif self.path.startswith("/query"):
+            self.send_body(b"time_recorded,mount_el,mount_az\n"
+                           b"2021-10-09 08:44:58.000000+00:00,60.0,120.0\n", "text/csv")
+        else:
+            self.send_error(404)
+
+    @classmethod
+    def hits(cls):
+        # How many times each upstream was hit.
+        return {"image": sum(p.startswith("/images/") for _, p in cls.requests),
+                "telemetry": sum(p.startswith("/query") for _, p in cls.requests)}
+
+
+async def fetch(port, target):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode("latin-1"))
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+
+    header, body = response.split(b"\r\n\r\n", 1)
+    status = int(header.split(b" ")[1])
+    return status, body
+
+
+class TestOverlayServer(unittest.TestCase):
+    def setUp(self):
+        url = start_upstream(self, Upstream)
+        patch_io(self, base_url=url + "/images/", telemetry_url=url + "/query")
+
+        # The telemetry download reads credentials from the working directory.
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        with open("auth.txt", "w") as f:
+            json.dump({"usr": "user", "pass": "pass"}, f)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def run_server(self, requests, default_pool=False):
+        async def run():
+            if default_pool:
+                server = OverlayServer(port=0)
+            else:
+                server = OverlayServer(port=0, executor=ThreadPoolExecutor(1))
+            self.executor = server.executor
+            await server.start()
+            try:
+                # Reading to EOF hangs if a connection is never really closed.
+                fetches = asyncio.gather(*[fetch(server.port, r) for r in requests])
+                return await asyncio.wait_for(fetches, 120)
+            finally:
+                await server.close()
+        return asyncio.run(run())
+
+    def test_coalesced_render(self):
+        # Times in the same two minutes are all the same image.
+        targets = [f"/image.png?time=2021-10-09T08:{t}&survey=1&pointing=1"
+                   for t in ("43:10", "43:30", "44:05", "44:05", "44:50")]
+        responses = self.run_server(targets)
+
+        for status, body in responses:
+            self.assertEqual(status, 200)
+            self.assertTrue(body.startswith(b"\x89PNG"))
+
+        # Five identical requests cost a single download and query.
+        self.assertEqual(Upstream.hits(), {"image": 1, "telemetry": 1})
+        images = [p for _, p in Upstream.requests if p.startswith("/images/")]
+        self.assertEqual(images, ["/images/2021/10/09/20211009_084405.jpg"])
+
+        # Closing the server shuts down its worker pool.
+        with self.assertRaises(RuntimeError):
+            self.executor.submit(print)
+
+    def test_overlay(self):
+        (status, body), = self.run_server(["/overlay.json?time=2021-10-09T08:44:05&pointing=1"])
+        self.assertEqual(status, 200)
+
+        survey, _, _, pointing = json.loads(body)["frame"]
+        self.assertEqual(len(survey), 2)
+        self.assertEqual(len(pointing), 2)
+        # The overlay doesn't need the image itself.
+        self.assertEqual(Upstream.hits(), {"image": 0, "telemetry": 1})
+
+    def test_process_pool(self):
+        # The default process pool starts its workers during the first request,
+        # which must not stop that request's connection from closing.
+        target = "/overlay.json?time=2021-10-09T08:44:05"
+        (status, body), = self.run_server([target], default_pool=True)
+        self.assertEqual(status, 200)
+        self.assertEqual(len(json.loads(body)["frame"]), 4)
+
+    def test_bad_requests(self):
+        responses = self.run_server(["/image.png", "/missing?time=2021-10-09T08:44:05"])
+        self.assertEqual([status for status, _ in responses], [400, 404])
@@ -0,0 +1,71 @@
+import tempfile
+import unittest
+
+from astropy.time import Time, TimeDelta
+
+from desipoint.video import (load_segment_state, resume_time, plan_segments,
+                             record_segment)
+
+start = Time("2021-10-09 04:00:05.000")
+
+def image_times(first, last):
+    # Images every 120 seconds from image `first` to image `last` inclusive.
+    return [start + TimeDelta(120 * i, format="sec") for i in range(first, last + 1)]
+
+class TestSegments(unittest.TestCase):
+    def setUp(self):
+        self.settings = {"start": str(start), "segment_length": 4}
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as d:
+            state = load_segment_state(d, self.settings)
+            self.assertEqual(state["segments"], [])
+            self.assertIsNone(resume_time(state))
+
+            record_segment(d, state, range(0, 4), start)
+            self.assertEqual(load_segment_state(d, self.settings), state)
+
+    def test_changed_settings(self):
+        with tempfile.TemporaryDirectory() as d:
+            state = load_segment_state(d, self.settings)
+            record_segment(d, state, range(0, 4), start)
+
+            # A different segment length invalidates the stored segments.
+            self.settings["segment_length"] = 2
+            self.assertEqual(load_segment_state(d, self.settings)["segments"], [])
+
+    def test_odd_length(self):
+        self.settings["segment_length"] = 3
+        with tempfile.TemporaryDirectory() as d:
+            with self.assertRaises(ValueError):
+                load_segment_state(d, self.settings)
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as d:
+            # First run sees images 0 to 5, which is 10 frames.
+            state = load_segment_state(d, self.settings)
+            times = image_times(0, 5)
+            plan = plan_segments(state, times, 4)
+            self.assertEqual([(i, f) for i, f, _ in plan],
+                             [(0, range(0, 4)), (1, range(4, 8)), (2, range(8, 10))])
+            for _, frames, end in plan:
+                record_segment(d, state, frames, end)
+
+            # The short last segment is closed too, and the next run starts
+            # from the last image, which hasn't been shown yet.
+            state = load_segment_state(d, self.settings)
+            self.assertEqual(str(resume_time(state)), str(times[-1]))
+
+            # Second run only renders the frames for images 5 to 7.
+            times = image_times(5, 7)
+            plan = plan_segments(state, times, 4)
+            self.assertEqual([(i, f) for i, f, _ in plan], [(3, range(0, 4))])
+            record_segment(d, state, plan[0][1], plan[0][2])
+            self.assertEqual(str(resume_time(state)), str(times[-1]))
+
+            # Every frame of the whole night is rendered exactly once.
+            self.assertEqual(sum(s["frames"] for s in state["segments"]),
+                             (len(image_times(0, 7)) - 1) * 2)
+
+            # Nothing new to render.
+            self.assertEqual(plan_segments(state, image_times(7, 7), 4), [])
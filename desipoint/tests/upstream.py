@@ -0,0 +1,46 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+import desipoint.io
+
+# Shared stand-ins for the image archive and telemetry database, so tests
+# never touch the real servers.
+class RecordingHandler(BaseHTTPRequestHandler):
+    """Request handler that records every (method, path) it is sent.
+
+    Each test's handler subclasses this and gets a fresh `requests` list
+    from `start_upstream`.
+    """
+    requests = []
+
+    def record(self):
+        type(self).requests.append((self.command, self.path))
+
+    def send_body(self, body, content_type="application/octet-stream"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_upstream(testcase, handler):
+    """Serve `handler` on a free local port until `testcase` finishes.
+
+    Returns the base URL of the server.
+    """
+    handler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    testcase.addCleanup(server.server_close)
+    testcase.addCleanup(server.shutdown)
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+def patch_io(testcase, **values):
+    """Point module level URLs in desipoint.io elsewhere for one test."""
+    for name, value in values.items():
+        testcase.addCleanup(setattr, desipoint.io, name, getattr(desipoint.io, name))
+        setattr(desipoint.io, name, value)
@@ -0,0 +1,124 @@
+from astropy.time import Time
+
+import json
+import os
+import subprocess
+
+state_name = "segments.json"
+
+def segment_path(directory, index):
+    """Path to the numbered video segment `index` in `directory`."""
+    return os.path.join(directory, f"segment_{index:04d}.mp4")
+
+def load_segment_state(directory, settings):
+    """Load the record of which video segments have already been rendered.
+
+    Parameters
+    ----------
+    directory : str
+        The directory the segments and their state file are stored in.
+    settings : dict
+        The settings the video is rendered with, such as the start time,
+        segment length and toggled overlays. If these differ from the settings
+        stored alongside the segments then the stored segments are discarded.
+        `segment_length` must be even, since each image is on screen for two
+        frames and segments need to start on an image boundary.
+
+    Returns
+    -------
+    state : dict
+        The segment state. `segments` holds one entry per rendered segment,
+        in order, with its number of `frames` and the `end` time of the first
+        image after it.
+
+    See Also
+    --------
+    resume_time : The time to continue rendering from.
+    """
+    if settings["segment_length"] % 2 == 1:
+        raise ValueError("segment_length must be even.")
+
+    fresh = {"settings": settings, "segments": []}
+    try:
+        with open(os.path.join(directory, state_name), "r") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return fresh
+
+    if state.get("settings") != settings:
+        print("Segment settings changed, rendering from the start.")
+        return fresh
+    return state
+
+def save_segment_state(directory, state):
+    os.makedirs(directory, exist_ok=True)
+
+    # Write to a temporary file first so an interrupted run never leaves
+    # behind a truncated state file.
+    loc = os.path.join(directory, state_name)
+    with open(loc + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(loc + ".tmp", loc)
+
+def resume_time(state):
+    """The time of the first image after the last rendered segment.
+
+    Returns None if nothing has been rendered yet.
+    """
+    if not state["segments"]:
+        return None
+    return Time(state["segments"][-1]["end"])
+
+def plan_segments(state, times, segment_length):
+    """Split the frames of a run into the segments to render.
+
+    Each image is on screen for two frames, and the last image of a run is
+    not shown, it is the first image of the next run instead. All frames of a
+    run are rendered, so the last segment may be shorter than
+    `segment_length`.
+
+    Parameters
+    ----------
+    state : dict
+        The segment state from `load_segment_state`.
+    times : list
+        The times of the images in this run, starting at `resume_time`.
+    segment_length : int
+        The most frames a segment can have.
+
+    Returns
+    -------
+    plan : list
+        One (index, frames, end) tuple per segment, where `index` is the
+        segment number, `frames` is the range of frames into this run and
+        `end` is the time of the first image after the segment.
+    """
+    n_frames = max(len(times) - 1, 0) * 2
+    index = len(state["segments"])
+
+    plan = []
+    for first in range(0, n_frames, segment_length):
+        last = min(first + segment_length, n_frames)
+        plan.append((index, range(first, last), times[last // 2]))
+        index += 1
+    return plan
+
+def record_segment(directory, state, frames, end):
+    """Record a rendered segment so later runs resume after it."""
+    state["segments"].append({"frames": len(frames), "end": str(end)})
+    save_segment_state(directory, state)
+
+def concat_segments(directory, n_segments, output):
+    """Join the first `n_segments` segments in `directory` into `output`.
+
+    The segments are joined with the ffmpeg concat demuxer, which copies the
+    encoded streams rather than re-encoding them.
+    """
+    list_loc = os.path.join(directory, "segments.txt")
+    with open(list_loc, "w") as f:
+        for i in range(n_segments):
+            f.write(f"file '{os.path.abspath(segment_path(directory, i))}'\n")
+
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "concat",
+                    "-safe", "0", "-i", list_loc, "-c", "copy", output],
+                   check=True)
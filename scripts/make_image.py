@@ -1,146 +1,84 @@
 #!/usr/bin/env python3
-import requests
-import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 from matplotlib.patches import Polygon, Circle, Rectangle
 from astropy.time import Time, TimeDelta
-from PIL import Image, UnidentifiedImageError
 
 import argparse
-import csv
 import json
 import os
-from io import BytesIO
 
 from desipoint.coordinates import radec_to_xy, altaz_to_xy, trim
-from desipoint.io import load_ecliptic, load_milky_way, load_survey
+from desipoint.io import (load_ecliptic, load_milky_way, load_survey, download_telemetry,
+                          download_telemetry_range, match_pointings, download_image,
+                          image_time, available_times)
 from desipoint.image import create_image
-
-base_url = "http://varuna.kpno.noirlab.edu/allsky-all/images/cropped/"
-
-class AllSkyImage():
-    def __init__(self, data, time):
-        self.data = data
-        self.time = time
+from desipoint.overlay import export_overlay, export_series, series_times
+from desipoint.video import (load_segment_state, resume_time, plan_segments,
+                             record_segment, segment_path, concat_segments)
 
 
 def create_video(start, end, toggle_mw=False, toggle_ep=False, toggle_survey=False,
-                 toggle_pointing=False):
+                 toggle_pointing=False, segment_dir=None, segment_length=120):
     # Start and end times for image range.
     start_time = Time(start).iso
     end_time = Time(end).iso
 
     # Updating the start time to be the next avaliable image.
-    temp_start = str(start_time)
-    minutes = int(temp_start[-9:-7])
-    # Sets minutes to next even minute if it is odd, and remains the same if even
-    minutes = (minutes + 1) // 2 * 2
-    temp_start = temp_start[:-9] + str(minutes) + ":05.000"
+    start_time = image_time(start_time)
+    date = str(start_time).split(" ")[0].replace("-", "")
 
-    start_time = Time(temp_start)
+    # When rendering in segments, pick up after the last segment from a
+    # previous run so only the new frames are downloaded and encoded.
+    if segment_dir is not None:
+        settings = {"start": str(start_time), "segment_length": segment_length,
+                    "toggles": [toggle_mw, toggle_ep, toggle_survey, toggle_pointing]}
+        state = load_segment_state(segment_dir, settings)
+        if resume_time(state) is not None:
+            start_time = resume_time(state)
+            print(f"Resuming after {len(state['segments'])} segments.")
 
-    # Loops over the given time period in 120s increments, getting the image at
-    # each time step.
     print(f"Video start at {str(start_time)}")
     print(f"Video end at {str(end_time)}")
 
-    if toggle_pointing:
-        try:
-            with open("auth.txt", "r") as f:
-                auth = json.load(f)
-        except Exception as e:
-            print("Loading authentication failed.")
-            print(e)
-            return
+    # Find which images exist up front so that no time is spent downloading
+    # the error pages for missing ones.
+    times = available_times(start_time, end_time)
+    print(f"{len(times)} images available.")
 
+    if toggle_pointing:
         print("Preparing to download images and telemetry.")
-        query_url = "https://replicator.desi.lbl.gov/TV3/app/Q/query"
-        params = {"namespace": "telemetry", "format": "csv",
-                  "sql": f"select time_recorded,mount_el,mount_az from telemetry.tcs_info where time_recorded >= TIMESTAMP '{str(start_time)}' AND time_recorded < TIMESTAMP '{str(end_time)}' order by time_recorded asc"}
-        # Ok so first get the resulting call, and decode it because its in bytes
-        # then feed it to a csv reader which we then convert to a list so
-        # now the table is a 2-d list.
-        r = requests.get(query_url, params=params, auth=(auth["usr"], auth["pass"]))
-        if r.status_code == 401:
-          print("Invalid authentication!")
-          return
-        decoded = r.content.decode("utf-8")
-        cr = csv.reader(decoded.splitlines(), delimiter=',')
-        results = list(cr)
-
-        # Then since the telemetry updates (on average) every ~4.3s, we need to
-        # only strip out the ones we want. So we loop over the telemetry
-        # and extra approx 20 timestamps near a minute later than the previous
-        # saved telemetry. We do this because it's way quicker to search 20
-        # rather than 10k for a single timestamp.
-        pre = 0
-
-        # Helper array of only the time stamps. This is the slowest part of this
-        # process, stripping out the time component only.
-        time_only = np.asarray([Time(r[0][:-6]) for r in results[1:-1]])
-
-        pointings = []
-        pointings.append(results[1])
-
-        # A small helper function that allows us to subtract times from a np array
-        # of times.
-        def sub_time(t1, t2):
-            t = t2 - t1
-            # Ensures we always find the lowest possible  positive difference
-            # from the next time.
-            if t < 0:
-              return 1000
-            else:
-              return t
-
-        v_sub = np.vectorize(sub_time)
+        results = download_telemetry_range(start_time, end_time)
+        if results is None:
+            return
+        if len(results) < 2:
+            # Only the column titles, the telescope didn't report in this range.
+            print("No telemetry, skipping the pointing.")
+            toggle_pointing = False
     else:
         print("Preparing to download images.")
 
     images = []
-    cur_time = start_time
-    counter = 0
-    while cur_time < end_time:
-        # Convert the time to a useable file name
-        t = str(cur_time)
-        d = t.split(" ")[0] # Extract the current date in case the range ticks over.
-        t = t.replace(":", "").replace("-", "").replace(" ", "_").split(".")[0]
-        file_name = t + ".jpg"
-
-        # Get the image data for this time from the server and then load
-        url = base_url + d.replace("-", "/") + "/" + file_name
-        try: # We only need to download images on even times.
-            if counter % 2 == 0:
-                response = requests.get(url)
-                img = np.asarray(Image.open(BytesIO(response.content)))
-
-                # Generate the Image object for appending.
-                temp = AllSkyImage(img, cur_time)
-                images.append(temp)
-
-        except UnidentifiedImageError:
-            print(f"{t} image not found, skipping")
-            # Increment to next image 120 seconds later.
-            counter += 2
-            cur_time += TimeDelta(120, format="sec")
-        else:
-            # I am fairly confident that the next 60s later update appears between 10
-            # and 30 telemetry updates from now.
-            # We find the next time by subtracting each stamp from the current one
-            # and then finding the minimum positive distance. Then the last update
-            # BEFORE the one minute per frame update is that index - 1. Don't need
-            # to subtract 1 since the addition of the column titles in results
-            # takes care of that already.
-            if toggle_pointing and counter > 1:
-                truncated_time = time_only[pre + 10: pre + 30]
-                time_test = v_sub(truncated_time, cur_time)
-
-                pre = np.argmin(time_test) + pre + 10
-                pointings.append(results[pre])
-            # Increment to next time 60 seconds later.
-            counter += 1
-            cur_time += TimeDelta(60, format="sec")
+    for t in times:
+        image = download_image(t)
+        if image is not None:
+            images.append(image)
+
+    # The first image of a run is the last image of the previous one, so it
+    # takes a second image before there are any new frames.
+    if segment_dir is not None and len(images) < 2:
+        print("No new frames to render.")
+        if state["segments"]:
+            concat_segments(segment_dir, len(state["segments"]), f"{date}.mp4")
+        return
+
+    if toggle_pointing:
+        # Each image is shown for two frames a minute apart, and each frame
+        # gets the last telemetry update from before its time.
+        frame_times = [images[n // 2].time + TimeDelta(60 * (n % 2), format="sec")
+                       for n in range((len(images) - 1) * 2)]
+        if frame_times:
+            pointings = match_pointings(results, frame_times)
 
     if toggle_pointing:
         print("Telemetry and images received and organized.")
@@ -247,11 +185,56 @@ def create_video(start, end, toggle_mw=False, toggle_ep=False, toggle_survey=Fal
         im.set_data(images[n].data)
         return im
 
-    ani = animation.FuncAnimation(fig, update_img, (len(images) - 1) * 2, interval=30)
-    writer = animation.writers['ffmpeg'](fps=20)
+    n_frames = (len(images) - 1) * 2
+    if segment_dir is None:
+        ani = animation.FuncAnimation(fig, update_img, n_frames, interval=30)
+        writer = animation.writers['ffmpeg'](fps=20)
+        ani.save(f"{date}.mp4", writer=writer, dpi=dpi)
+        return
+
+    # Every segment is closed at the end of the run, so earlier segments are
+    # never rendered again.
+    for index, frames, end in plan_segments(state, [im.time for im in images], segment_length):
+        print(f"Rendering segment {index}.")
+
+        ani = animation.FuncAnimation(fig, update_img, frames, interval=30)
+        writer = animation.writers['ffmpeg'](fps=20)
+        ani.save(segment_path(segment_dir, index), writer=writer, dpi=dpi)
+        record_segment(segment_dir, state, frames, end)
+
+    concat_segments(segment_dir, len(state["segments"]), f"{date}.mp4")
+
+def create_overlay(start, end=None, toggle_pointing=False, tolerance=0.5):
+    # Start and end times for the overlay range, starting at an image time so
+    # the overlay lines up with the image it is drawn on.
+    start_time = image_time(start)
+    date = start_time.iso.split(" ")[0].replace("-", "")
+
+    if end is None:
+        pointing = None
+        if toggle_pointing:
+            telemetry = download_telemetry(start_time)
+            if telemetry is None or len(telemetry) < 2:
+                print("No telemetry, skipping the pointing.")
+            else:
+                pointing = telemetry[1]
+        overlay = export_overlay(start_time, pointing, tolerance)
+    else:
+        pointings = None
+        if toggle_pointing:
+            # One query for the whole range, starting a minute early so the
+            # first frame has an update from before it. Frames are every
+            # 120s, the same as the image cadence.
+            telemetry = download_telemetry_range(start_time - TimeDelta(60, format="sec"), end)
+            if telemetry is None or len(telemetry) < 2:
+                print("No telemetry, skipping the pointing.")
+            else:
+                pointings = match_pointings(telemetry, series_times(start_time, end, 120))
+        overlay = export_series(start_time, end, 120, pointings, tolerance)
 
-    date = str(start_time).split(" ")[0].replace("-", "")
-    ani.save(f"{date}.mp4", writer=writer, dpi=dpi)
+    with open(f"{date}.json", "w") as f:
+        json.dump(overlay, f, separators=(",", ":"))
+    print(f"Overlay saved to {date}.json")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -261,6 +244,8 @@ if __name__ == "__main__":
 
     # Optional arguments
     parser.add_argument("-im", "--image", help="whether or not to make a single image", action="store_true")
+    parser.add_argument("-o", "--overlay", help="only export the overlay geometry as JSON, for the start time or the range to the end time", action="store_true")
+    parser.add_argument("-t", "--tolerance", help="overlay simplification tolerance in pixels", type=float, default=0.5)
     parser.add_argument("-e", "--end", help="ending time of the video, in ISO-8601 format", default=None)
 
     parser.add_argument("-mw", "--milkyway", help="toggle the milky way", action="store_true")
@@ -268,10 +253,15 @@ if __name__ == "__main__":
     parser.add_argument("-s", "--survey", help="toggle the survey area", action="store_true")
     parser.add_argument("-p", "--pointing", help="toggle the telescope pointing", action="store_true")
     parser.add_argument("-a", "--all", help="toggle everything", action="store_true")
+    parser.add_argument("--segments", help="directory to render the video into in segments, only new segments are rendered on later runs", default=None)
+    parser.add_argument("--segment-length", help="number of frames per segment, must be even", type=int, default=120)
 
     args = parser.parse_args()
 
-    if args.image:
+    if args.overlay:
+        create_overlay(args.start, args.end, args.pointing or args.all, args.tolerance)
+
+    elif args.image:
         if args.all:
             create_image(args.start, None, True, True, True)
         else:
@@ -279,9 +269,10 @@ if __name__ == "__main__":
 
     elif args.end:
         if args.all:
-            create_video(args.start, args.end, True, True, True, True)
+            create_video(args.start, args.end, True, True, True, True,
+                         args.segments, args.segment_length)
         else:
             create_video(args.start, args.end, args.milkyway, args.ecliptic,
-                        args.survey, args.pointing)
+                        args.survey, args.pointing, args.segments, args.segment_length)
     else:
         print("If you request a movie, you must specify an ending time.")